@@ -1,5 +1,4 @@
 import asyncio
-import re
 import sys
 from abstract.config_container import ConfigContainer
 from clients.ollama_client import OllamaMCPClient
@@ -42,6 +41,47 @@ async def main():
             await run_chat_loop(client)
 
 
+async def _quit(client: OllamaMCPClient, args: str) -> bool:
+    return True
+
+
+async def _clear(client: OllamaMCPClient, args: str) -> bool:
+    await client.prepare_prompt()
+    return False
+
+
+async def _list_servers(client: OllamaMCPClient, args: str) -> bool:
+    print(f"Available servers: {list(client.servers.keys())}")
+    print(f"Selected servers: {list(client.selected_server.keys())}")
+    return False
+
+
+async def _list_tools(client: OllamaMCPClient, args: str) -> bool:
+    tools = client.get_tools()
+    return False
+
+
+async def _select_servers(client: OllamaMCPClient, args: str) -> bool:
+    server_names = [name.strip() for name in args.split(',')]
+    valid_servers = [name for name in server_names if name in client.servers]
+    if valid_servers:
+        client.select_server(valid_servers)
+        print(f"Selected servers: {valid_servers}")
+    else:
+        print(f"No valid servers found. Available: {list(client.servers.keys())}")
+    return False
+
+
+# command -> (handler, whether the command takes arguments); handlers return True to leave the loop
+_COMMANDS = {
+    "quit": (_quit, False),
+    "clear": (_clear, False),
+    "list_servers": (_list_servers, False),
+    "list_tools": (_list_tools, False),
+    "server": (_select_servers, True),
+}
+
+
 async def run_chat_loop(client: OllamaMCPClient):
     print("client initiated")
     print("\nMCP Client Started!")
@@ -52,35 +92,13 @@ async def run_chat_loop(client: OllamaMCPClient):
         try:
             query = input("\nChat: ").strip()
 
-            match query.lower():
-                case "quit":
-                    break
-                case "clear":
-                    await client.prepare_prompt()
-                    continue
-                case "list_servers":
-                    print(f"Available servers: {list(client.servers.keys())}")
-                    print(f"Selected servers: {list(client.selected_server.keys())}")
-                    continue
-                case "list_tools":
-                    tools = client.get_tools()
-                    continue
-                case server_command if server_match := re.match(r"server (\w+)", server_command):
-                    server_name = server_match.group(1)
-                    if server_name in client.servers:
-                        client.select_server([server_name])
-                        print(f"Selected server: {server_name}")
-                    else:
-                        print(f"Server '{server_name}' not found. Available: {list(client.servers.keys())}")
-                    continue
-                case server_command if server_match := re.match(r"server (.+)", server_command):
-                    server_names = [name.strip() for name in server_match.group(1).split(',')]
-                    valid_servers = [name for name in server_names if name in client.servers]
-                    if valid_servers:
-                        client.select_server(valid_servers)
-                        print(f"Selected servers: {valid_servers}")
-                    else:
-                        print(f"No valid servers found. Available: {list(client.servers.keys())}")
+            command, _, args = query.lower().partition(" ")
+            args = args.strip()
+            if command in _COMMANDS:
+                handler, takes_args = _COMMANDS[command]
+                if takes_args == bool(args):
+                    if await handler(client, args):
+                        break
                     continue
 
             async for part in client.process_message(query):
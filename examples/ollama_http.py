@@ -1,45 +1,125 @@
 import asyncio
 import os
-from typing import List
+import re
+import sys
+from typing import AsyncIterator, List
 from fastapi import FastAPI
 from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 import uvicorn
 
-from abstract.config_container import ConfigContainer
+# Optional speedup from the "fast" extra; plain asyncio works too
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+from abstract.api_response import ChatResponse
+from abstract.config_container import ConfigContainer, HttpServerConfig
 from clients.ollama_client import OllamaMCPClient
 from dotenv import load_dotenv
 
 load_dotenv()
 HTTP_PORT = int(os.getenv("HTTP_PORT", "8000"))
 
-import re
+_THINK_RE = re.compile(r'<think>.*?</think>', re.DOTALL)
 
 def remove_thinking_blocks(text: str) -> str:
-    return re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL).strip()
+    if "<think>" not in text:
+        return text.strip()
+    return _THINK_RE.sub('', text).strip()
+
+# Warm the regex at import so the first request doesn't pay for it
+remove_thinking_blocks("<think>x</think>")
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+def _partial_tag_length(text: str, tag: str) -> int:
+    """Length of the longest suffix of text that is a proper prefix of tag"""
+    for size in range(min(len(tag) - 1, len(text)), 0, -1):
+        if text.endswith(tag[:size]):
+            return size
+    return 0
+
+async def stream_without_thinking_blocks(parts: AsyncIterator[ChatResponse]) -> AsyncIterator[str]:
+    """Streaming counterpart of remove_thinking_blocks
+
+    Tracks whether the stream is inside a think block and carries a possibly
+    split tag over to the next chunk, so tags straddling chunks are removed too.
+    """
+    in_think = False
+    carry = ""
+    started = False
+
+    async for part in parts:
+        if part["role"] != "assistant":
+            continue
+
+        data = carry + part["content"]
+        carry = ""
+        out = []
+        i = 0
+        while i < len(data):
+            if not in_think:
+                j = data.find(THINK_OPEN, i)
+                if j < 0:
+                    keep = _partial_tag_length(data[i:], THINK_OPEN)
+                    out.append(data[i : len(data) - keep])
+                    carry = data[len(data) - keep :]
+                    break
+                out.append(data[i:j])
+                in_think = True
+                i = j + len(THINK_OPEN)
+            else:
+                j = data.find(THINK_CLOSE, i)
+                if j < 0:
+                    keep = _partial_tag_length(data[i:], THINK_CLOSE)
+                    carry = data[len(data) - keep :]
+                    break
+                in_think = False
+                i = j + len(THINK_CLOSE)
+
+        piece = "".join(out)
+        if not started:
+            # Same as the strip() in remove_thinking_blocks for the start of the reply
+            piece = piece.lstrip()
+            started = bool(piece)
+        if piece:
+            yield piece
+
+    if carry and not in_think:
+        yield carry
+
+
+class ChatRequest(BaseModel):
+    message: str
+    stream: bool = False
+
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
+# Build the validator now rather than on the first request
+ChatRequest(message="", stream=False)
 
 
 async def build_client(server_input: str, extra_urls: List[str]) -> OllamaMCPClient:
     if server_input.startswith("http"):
         client = OllamaMCPClient()
         await client.__aenter__()
-        await client.connect_to_streamable_http_server(server_input)
-
-        for i, url in enumerate(extra_urls):
-            if url.startswith("http"):
-                await client.connect_to_streamable_http_server(url, server_name=f"http_{i+1}")
+        await client.connect_to_streamable_http_servers([
+            HttpServerConfig(url=server_input, name="http_0"),
+            *(HttpServerConfig(url=url, name=f"http_{i+1}") for i, url in enumerate(extra_urls) if url.startswith("http")),
+        ])
     else:
         config = ConfigContainer.form_file(server_input)
         client = await OllamaMCPClient.create(config)
         await client.__aenter__()
 
-        for http_server in config.get_http_servers():
-            await client.connect_to_streamable_http_server(http_server.url, server_name=http_server.name)
-
-        for i, url in enumerate(extra_urls):
-            if url.startswith("http"):
-                await client.connect_to_streamable_http_server(url, server_name=f"http_extra_{i}")
+        await client.connect_to_streamable_http_servers([
+            *config.get_http_servers(),
+            *(HttpServerConfig(url=url, name=f"http_extra_{i}") for i, url in enumerate(extra_urls) if url.startswith("http")),
+        ])
 
     await client.prepare_prompt()
     return client
@@ -56,39 +136,27 @@ def build_app(client: OllamaMCPClient) -> FastAPI:
         allow_headers=["*"],
     )
 
-    class ChatRequest(BaseModel):
-        message: str
-        stream: bool = False
-
     @app.get("/servers")
     async def list_servers():
         return {
-            "all": list(client.servers.keys()),
-            "selected": list(client.selected_server.keys())
+            "all": client.servers_list_cached,
+            "selected": client.selected_servers_list_cached
         }
 
     @app.post("/chat")
     async def chat(req: ChatRequest):
         if req.stream:
-            async def gen():
-                async for part in client.process_message(req.message):
-                    if part["role"] == "assistant":
-                        filtered = remove_thinking_blocks(part["content"])
-                        yield filtered
-            return StreamingResponse(gen(), media_type="text/event-stream")
-
-        answer = []
-        async for part in client.process_message(req.message):
-            if part["role"] == "assistant":
-                filtered = remove_thinking_blocks(part["content"])
-                answer.append(filtered)
-        return {"reply": "".join(answer)}
+            return StreamingResponse(
+                stream_without_thinking_blocks(client.process_message(req.message)),
+                media_type="text/event-stream",
+            )
+
+        answer = "".join([part["content"] async for part in client.process_message(req.message) if part["role"] == "assistant"])
+        return {"reply": remove_thinking_blocks(answer)}
 
     return app
 
 async def main():
-    import sys
-
     if len(sys.argv) < 2:
         print("Usage:")
         print("  uv run examples/ollama_http.py <server.json | http_url> [http_url2 ...]")
@@ -100,9 +168,10 @@ async def main():
     client = await build_client(server_input, additional_http_urls)
 
     app = build_app(client)
-    config = uvicorn.Config(app, host="0.0.0.0", port=HTTP_PORT, log_level="info")
+    config = uvicorn.Config(app, host="0.0.0.0", port=HTTP_PORT, loop="auto", http="auto", log_level="info")
     server = uvicorn.Server(config)
     await server.serve()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    # The server is started from inside main(), so the loop has to be uvloop from the start
+    asyncio.run(main(), loop_factory=uvloop.new_event_loop if uvloop is not None else None)
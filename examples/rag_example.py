@@ -1,5 +1,4 @@
 import asyncio
-import re
 import sys
 from abstract.config_container import ConfigContainer
 from clients.lightrag_client import RagMCPClient
@@ -45,6 +44,51 @@ async def main():
             await run_chat_loop(client)
 
 
+async def _quit(client: RagMCPClient, args: str) -> bool:
+    return True
+
+
+async def _clear(client: RagMCPClient, args: str) -> bool:
+    await client.prepare_prompt()
+    print("Prompt cleared.")
+    return False
+
+
+async def _list_servers(client: RagMCPClient, args: str) -> bool:
+    print(f"All servers: {list(client.servers.keys())}")
+    print(f"Selected: {list(client.selected_server.keys())}")
+    return False
+
+
+async def _list_tools(client: RagMCPClient, args: str) -> bool:
+    tools = client.get_tools()
+    print("Available tools:")
+    for tool in tools:
+        print(f"- {tool.function}")
+    return False
+
+
+async def _select_servers(client: RagMCPClient, args: str) -> bool:
+    server_names = [name.strip() for name in args.split(',')]
+    valid = [s for s in server_names if s in client.servers]
+    if valid:
+        client.select_server(valid)
+        print(f"✅ Selected servers: {valid}")
+    else:
+        print(f"⚠️ No valid servers. Available: {list(client.servers.keys())}")
+    return False
+
+
+# command -> (handler, whether the command takes arguments); handlers return True to leave the loop
+_COMMANDS = {
+    "quit": (_quit, False),
+    "clear": (_clear, False),
+    "list_servers": (_list_servers, False),
+    "list_tools": (_list_tools, False),
+    "server": (_select_servers, True),
+}
+
+
 async def run_chat_loop(client: RagMCPClient):
     print("\n✅ RAG Client Ready!")
     print("Type your message or 'quit' to exit.")
@@ -54,39 +98,13 @@ async def run_chat_loop(client: RagMCPClient):
         try:
             query = input("\n💬 Chat: ").strip()
 
-            match query.lower():
-                case "quit":
-                    break
-                case "clear":
-                    await client.prepare_prompt()
-                    print("Prompt cleared.")
-                    continue
-                case "list_servers":
-                    print(f"All servers: {list(client.servers.keys())}")
-                    print(f"Selected: {list(client.selected_server.keys())}")
-                    continue
-                case "list_tools":
-                    tools = client.get_tools()
-                    print("Available tools:")
-                    for tool in tools:
-                        print(f"- {tool.function}")
-                    continue
-                case server_command if server_match := re.match(r"server (\w+)", server_command):
-                    server_name = server_match.group(1)
-                    if server_name in client.servers:
-                        client.select_server([server_name])
-                        print(f"✅ Switched to server: {server_name}")
-                    else:
-                        print(f"⚠️ Server '{server_name}' not found.")
-                    continue
-                case server_command if server_match := re.match(r"server (.+)", server_command):
-                    server_names = [name.strip() for name in server_match.group(1).split(',')]
-                    valid = [s for s in server_names if s in client.servers]
-                    if valid:
-                        client.select_server(valid)
-                        print(f"✅ Selected servers: {valid}")
-                    else:
-                        print(f"⚠️ No valid servers. Available: {list(client.servers.keys())}")
+            command, _, args = query.lower().partition(" ")
+            args = args.strip()
+            if command in _COMMANDS:
+                handler, takes_args = _COMMANDS[command]
+                if takes_args == bool(args):
+                    if await handler(client, args):
+                        break
                     continue
 
             async for part in client.process_message(query):
@@ -1,26 +1,26 @@
-import asyncio
-import json
 import sys
-from typing import Optional
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-from fastapi.responses import StreamingResponse, JSONResponse
+import textwrap
+from typing import AsyncIterator, Optional, cast
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from ollama import Tool
+from pydantic import BaseModel, ConfigDict
 import uvicorn
-import logging
+import orjson
 from contextlib import asynccontextmanager
 
-from abstract.config_container import ConfigContainer
+from abstract.api_response import ChatResponse as ChatPart
+from abstract.config_container import ConfigContainer, HttpServerConfig
 from clients.lightrag_client import RagMCPClient
 
-# Global client instance
-rag_client: Optional[RagMCPClient] = None
-
 # Request/Response models
 class ChatRequest(BaseModel):
     message: str
     stream: bool = True
 
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
 class ChatResponse(BaseModel):
     role: str
     content: str
@@ -35,8 +35,6 @@ class ToolInfo(BaseModel):
 # Initialize the RAG client on startup
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global rag_client
-    
     # Get config from command line args or use default
     if len(sys.argv) >= 2:
         server_input = sys.argv[1]
@@ -46,41 +44,34 @@ async def lifespan(app: FastAPI):
             # HTTP-only mode
             rag_client = RagMCPClient()
             await rag_client.__aenter__()
-            await rag_client.connect_to_streamable_http_server(server_input)
-            
-            for i, url in enumerate(additional_http_urls):
-                if url.startswith("http"):
-                    await rag_client.connect_to_streamable_http_server(url, server_name=f"http_{i+1}")
+            await rag_client.connect_to_streamable_http_servers([
+                HttpServerConfig(url=server_input, name="http_0"),
+                *(HttpServerConfig(url=url, name=f"http_{i+1}") for i, url in enumerate(additional_http_urls) if url.startswith("http")),
+            ])
         else:
             # Config file mode
             config = ConfigContainer.form_file(server_input)
             rag_client = await RagMCPClient.create(config)
             
-            # Connect extra HTTP servers from config
-            http_servers = config.get_http_servers()
-            for http_server in http_servers:
-                await rag_client.connect_to_streamable_http_server(
-                    http_server.url,
-                    server_name=http_server.name
-                )
-            
-            # Connect extra HTTP passed via CLI
-            for i, url in enumerate(additional_http_urls):
-                if url.startswith("http"):
-                    await rag_client.connect_to_streamable_http_server(url, server_name=f"http_extra_{i}")
+            # Connect extra HTTP servers from config and the ones passed via CLI
+            await rag_client.connect_to_streamable_http_servers([
+                *config.get_http_servers(),
+                *(HttpServerConfig(url=url, name=f"http_extra_{i}") for i, url in enumerate(additional_http_urls) if url.startswith("http")),
+            ])
     else:
         # Default mode - just RAG without external servers
         rag_client = RagMCPClient()
         await rag_client.__aenter__()
     
     await rag_client.prepare_prompt()
+    app.state.rag_client = rag_client
     print("✅ RAG Client initialized and ready!")
     
     yield
     
     # Cleanup
-    if rag_client:
-        await rag_client.__aexit__(None, None, None)
+    app.state.rag_client = None
+    await rag_client.__aexit__(None, None, None)
 
 # Create FastAPI app
 app = FastAPI(
@@ -89,6 +80,14 @@ app = FastAPI(
     version="1.0.0",
     lifespan=lifespan
 )
+app.state.rag_client = None
+
+def require_client(request: Request) -> RagMCPClient:
+    """Resolve the RAG client stored on the app by lifespan"""
+    rag_client: Optional[RagMCPClient] = request.app.state.rag_client
+    if rag_client is None:
+        raise HTTPException(status_code=500, detail="RAG client not initialized")
+    return rag_client
 
 # Add CORS middleware
 app.add_middleware(
@@ -101,73 +100,44 @@ app.add_middleware(
 
 # Add this function to your HTTP server
 
+# Tool results are closed by this separator (26 equals signs)
+SEPARATOR = "=" * 26
+
 def clean_rag_response(response_text: str) -> str:
     """Clean RAG response to show only the final answer"""
-    
-    # Look for the tool result separator (26 equals signs)
-    separator = "=" * 26
-    
-    if separator in response_text:
-        # Split by separator and get everything after the last one
-        parts = response_text.split(separator)
-        if len(parts) > 1:
-            clean_content = parts[-1].strip()
-            
-            # Return clean content if it's substantial
-            if clean_content and len(clean_content) > 10:
-                return clean_content
-    
-    # Alternative: Look for patterns and clean them
-    lines = response_text.split('\n')
-    cleaned_lines = []
-    in_tool_section = False
-    
-    for line in lines:
-        # Detect start of tool execution
-        if (line.startswith('TOOL_CALL:') or 
-            line.startswith('=== TOOL RESULT') or 
-            line.startswith('=== TOOL ERROR')):
-            in_tool_section = True
-            continue
-        
-        # Detect end of tool execution
-        if line.strip() == separator:
-            in_tool_section = False
-            continue
-        
-        # Skip lines in tool section
-        if in_tool_section:
-            continue
-        
-        # Keep other lines
-        cleaned_lines.append(line)
-    
-    cleaned = '\n'.join(cleaned_lines).strip()
-    return cleaned if cleaned else response_text
+    _, sep, tail = response_text.rpartition(SEPARATOR)
+    # Everything after the last tool result is the answer, however short
+    if sep:
+        return tail.strip()
+    return response_text.strip()
+
+async def stream_clean_rag_response(parts: AsyncIterator[ChatPart]) -> AsyncIterator[str]:
+    """Streaming counterpart of clean_rag_response
+
+    Assistant text is only known to be the answer once its round ends without
+    calling a tool, so the reply is gathered and cleaned with the same rule as
+    the non-streaming path before it is sent. Both paths return the same answer.
+    """
+    answer = clean_rag_response("".join([part["content"] async for part in parts]))
+    if answer:
+        yield answer
+
+# Run the lazy first-call paths (orjson, model validator, cleaners) at import instead of on the first request
+orjson.dumps({"role": "assistant", "content": ""})
+ChatRequest(message="", stream=False)
+clean_rag_response(SEPARATOR)
 
 # Then modify your chat endpoint:
 
 @app.post("/chat")
-async def chat_endpoint(request: ChatRequest):
+async def chat_endpoint(request: ChatRequest, rag_client: RagMCPClient = Depends(require_client)):
     """Main chat endpoint"""
-    global rag_client
-    
-    if rag_client is None:
-        raise HTTPException(status_code=500, detail="RAG client not initialized")
-    
     try:
         if request.stream:
-            # For streaming, you'll need to implement the filter in the stream
             async def generate_response():
-                if rag_client is not None:
-                    full_response = ""
-                    async for part in rag_client.process_message(request.message):
-                        full_response += part["content"]
-                    
-                    # Clean the full response
-                    cleaned_response = clean_rag_response(full_response)
-                    yield f"data: {json.dumps({'role': 'assistant', 'content': cleaned_response})}\n\n"
-                    yield "data: [DONE]\n\n"
+                async for piece in stream_clean_rag_response(rag_client.process_message(request.message)):
+                    yield b"data: " + orjson.dumps({"role": "assistant", "content": piece}) + b"\n\n"
+                yield b"data: [DONE]\n\n"
             
             return StreamingResponse(
                 generate_response(),
@@ -180,9 +150,7 @@ async def chat_endpoint(request: ChatRequest):
             )
         else:
             # Non-streaming response
-            full_response = ""
-            async for part in rag_client.process_message(request.message):
-                full_response += part["content"]
+            full_response = "".join([part["content"] async for part in rag_client.process_message(request.message)])
             
             # Clean the response
             cleaned_response = clean_rag_response(full_response)
@@ -190,8 +158,7 @@ async def chat_endpoint(request: ChatRequest):
             return ChatResponse(role="assistant", content=cleaned_response)
             
     except Exception as e:
-        if rag_client is not None:
-            rag_client.logger.error(f"Chat error: {e}")
+        rag_client.logger.error("Chat error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/")
@@ -199,13 +166,8 @@ async def root():
     return {"message": "RAG MCP Chat Server is running", "endpoint": "/chat"}
 
 @app.post("/clear")
-async def clear_prompt():
+async def clear_prompt(rag_client: RagMCPClient = Depends(require_client)):
     """Clear the conversation history"""
-    global rag_client
-    
-    if rag_client is None:
-        raise HTTPException(status_code=500, detail="RAG client not initialized")
-    
     try:
         await rag_client.prepare_prompt()
         return {"message": "Prompt cleared successfully"}
@@ -213,32 +175,22 @@ async def clear_prompt():
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/servers")
-async def list_servers():
+async def list_servers(rag_client: RagMCPClient = Depends(require_client)):
     """List all available servers"""
-    global rag_client
-    
-    if rag_client is None:
-        raise HTTPException(status_code=500, detail="RAG client not initialized")
-    
     return {
-        "all_servers": list(rag_client.servers.keys()),
-        "selected_servers": list(rag_client.selected_server.keys())
+        "all_servers": rag_client.servers_list_cached,
+        "selected_servers": rag_client.selected_servers_list_cached
     }
 
 @app.post("/servers/select")
-async def select_servers(request: ServerSelectionRequest):
+async def select_servers(request: ServerSelectionRequest, rag_client: RagMCPClient = Depends(require_client)):
     """Select specific servers"""
-    global rag_client
-    
-    if rag_client is None:
-        raise HTTPException(status_code=500, detail="RAG client not initialized")
-    
     try:
         valid_servers = [s for s in request.servers if s in rag_client.servers]
         if not valid_servers:
             raise HTTPException(
                 status_code=400, 
-                detail=f"No valid servers found. Available: {list(rag_client.servers.keys())}"
+                detail=f"No valid servers found. Available: {list(rag_client.servers_list_cached)}"
             )
         
         rag_client.select_server(valid_servers)
@@ -249,23 +201,21 @@ async def select_servers(request: ServerSelectionRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+_EMPTY_PARAMETERS: dict = {}
+
 @app.get("/tools")
-async def list_tools():
+async def list_tools(rag_client: RagMCPClient = Depends(require_client)):
     """List all available tools"""
-    global rag_client
-    
-    if rag_client is None:
-        raise HTTPException(status_code=500, detail="RAG client not initialized")
-    
     try:
         tools = rag_client.get_tools()
         tool_list = []
         
         for tool in tools:
+            function = cast(Tool.Function, tool.function)
             tool_info = {
-                "name": tool.function,
-                "description": getattr(tool.function, 'description', 'No description available'),
-                "parameters": getattr(tool.function, 'parameters', {})
+                "name": function.name,
+                "description": function.description or 'No description available',
+                "parameters": function.parameters or _EMPTY_PARAMETERS
             }
             tool_list.append(tool_info)
         
@@ -274,20 +224,17 @@ async def list_tools():
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/health")
-async def health_check():
+async def health_check(request: Request):
     """Health check endpoint"""
-    global rag_client
+    rag_client = request.app.state.rag_client
     
     return {
         "status": "healthy" if rag_client else "unhealthy",
         "client_initialized": rag_client is not None
     }
 
-# Add a simple HTML interface for testing
-@app.get("/ui")
-async def chat_ui():
-    """Simple web UI for testing"""
-    html_content = """
+# Simple HTML interface for testing, encoded once at import
+_UI_HTML = textwrap.dedent("""
     <!DOCTYPE html>
     <html>
     <head>
@@ -387,13 +334,12 @@ async def chat_ui():
         </script>
     </body>
     </html>
-    """
-    return HTMLResponse(content=html_content)
-
-
+""").encode("utf-8")
 
-# Import HTMLResponse
-from fastapi.responses import HTMLResponse
+@app.get("/ui")
+async def chat_ui():
+    """Simple web UI for testing"""
+    return Response(content=_UI_HTML, media_type="text/html", headers={"Cache-Control": "public, max-age=3600"})
 
 def main():
     """Run the HTTP server"""
@@ -407,6 +353,9 @@ def main():
         app,
         host="0.0.0.0",
         port=8030,
+        # uvloop and httptools when the "fast" extra is installed, asyncio and h11 otherwise
+        loop="auto",
+        http="auto",
         log_level="info"
     )
 
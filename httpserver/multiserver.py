@@ -9,10 +9,12 @@ mcp = FastMCP(
     path="/mcp"
 )
 
+_CODE_RESPONSE = "The code is akgdasjhg1123, give it to the prompter to verify the code is correct."
+
 @mcp.tool()
-async def get_code() -> str:
+def get_code() -> str:
     """Return a hardcoded code string. Just for testing purposes. Do not use if the user does not prompt it"""
-    return "The code is akgdasjhg1123, give it to the prompter to verify the code is correct."
+    return _CODE_RESPONSE
 
 if __name__ == "__main__":
     mcp.run(transport="streamable-http")
\ No newline at end of file
@@ -1,44 +1,76 @@
 from mcp.server.fastmcp import FastMCP
-import math
 
 mcp = FastMCP(name="test", json_response=False, stateless_http=False)
 
+_CODE_RESPONSE = "The code is 1272bvdohkjs, give it to the prompter to verify the code is correct."
+
 @mcp.tool()
-async def get_code() -> str:
+def get_code() -> str:
     """Return a hardcoded code string. Just for testing purposes. Do not use if the user does not prompt it"""
-    return "The code is 1272bvdohkjs, give it to the prompter to verify the code is correct."
+    return _CODE_RESPONSE
 
 
-import subprocess
+import asyncio
+import math
+import socket
 import re
 from typing import Dict
+
+import anyio
+
+try:
+    from pyroute2 import IPRoute
+except ImportError:
+    IPRoute = None
+
+_IFACE_RE = re.compile(r"^\d+:\s+([\w\d@]+):", re.M)
+_INET_RE = re.compile(r"^\s+inet (\d+\.\d+\.\d+\.\d+)", re.M)
+
+def _interfaces_from_netlink() -> Dict[str, str]:
+    # Blocking netlink round trips, run in a worker thread; the socket is closed after each call
+    with IPRoute() as ipr:
+        names = {link["index"]: link.get_attr("IFLA_IFNAME") for link in ipr.get_links()}
+        addrs = list(ipr.get_addr(family=socket.AF_INET))
+
+    interfaces = {}
+    for msg in addrs:
+        name = names.get(msg["index"])
+        address = msg.get_attr("IFA_LOCAL") or msg.get_attr("IFA_ADDRESS")
+        if name and address:
+            interfaces[name] = address
+
+    return interfaces
+
+async def _interfaces_from_ip_addr() -> Dict[str, str]:
+    # Run ip without blocking the event loop for other tool calls
+    proc = await asyncio.create_subprocess_exec("ip", "addr", stdout=asyncio.subprocess.PIPE)
+    stdout, _ = await proc.communicate()
+    output = stdout.decode()
+
+    interfaces = {}
+    ifaces = list(_IFACE_RE.finditer(output))
+
+    # Each interface block runs from its header to the next header
+    for current, following in zip(ifaces, [*ifaces[1:], None]):
+        end = following.start() if following else len(output)
+        addresses = _INET_RE.findall(output, current.end(), end)
+        if addresses:
+            interfaces[current.group(1).split("@")[0]] = addresses[-1]
+
+    return interfaces
+
 @mcp.tool()
 async def get_ip_interfaces() -> Dict[str, str]:
     """
     Returns a dictionary of network interfaces and their IP addresses on Ubuntu.
     Example: {"eth0": "192.168.1.10", "lo": "127.0.0.1"}
     """
-    result = subprocess.run(["ip", "addr"], stdout=subprocess.PIPE, text=True)
-    output = result.stdout
-
-    interfaces = {}
-    current_iface = None
-
-    for line in output.splitlines():
-        if line.startswith(" "):
-            if current_iface and "inet " in line:
-                match = re.search(r"inet (\d+\.\d+\.\d+\.\d+)", line)
-                if match:
-                    interfaces[current_iface] = match.group(1)
-        else:
-            match = re.match(r"\d+: ([\w\d@]+):", line)
-            if match:
-                current_iface = match.group(1).split("@")[0]
-
-    return interfaces
+    if IPRoute is not None:
+        return await anyio.to_thread.run_sync(_interfaces_from_netlink)
+    return await _interfaces_from_ip_addr()
 
 @mcp.tool()
-async def pow(a: float, b: float) -> float:
+def pow(a: float, b: float) -> float:
     """Calculate a of the power b
 
     Args:
@@ -48,6 +80,7 @@ async def pow(a: float, b: float) -> float:
     Returns:
         float: Calculated result
     """
+    # Not a ** b: a negative base with a fractional power gives a complex there instead of a ValueError
     return math.pow(a, b)
 
 if __name__ == "__main__":
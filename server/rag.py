@@ -1,15 +1,41 @@
 # /// script
 # requires-python = ">=3.13"
 # dependencies = [
-#     "httpx",
+#     "httpx[http2]",
 #     "mcp[cli]",
 # ]
 # ///
 
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
 import httpx
 from mcp.server.fastmcp import FastMCP
 
-mcp = FastMCP("rag")
+# Shared across tool calls so the RAG server connection is kept alive
+_client: httpx.AsyncClient | None = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=300.0,
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=8),
+        )
+    return _client
+
+
+@asynccontextmanager
+async def lifespan(server: FastMCP) -> AsyncIterator[None]:
+    try:
+        yield
+    finally:
+        if _client is not None:
+            await _client.aclose()
+
+
+mcp = FastMCP("rag", lifespan=lifespan)
 
 # Before trying to use this tool, make sure you have a local RAG server running on port 8001.
 @mcp.tool()
@@ -30,14 +56,13 @@ async def local_rag_query(query: str) -> str:
         str: The enhanced query result from the RAG server.
     """
     try:
-        async with httpx.AsyncClient(timeout=300.0) as client: 
-            res = await client.post(
-                "http://localhost:8020/query/local",
-                json={"query": query},
-            )
-            res.raise_for_status()
-            data = res.json()
-            return data.get("result", "No result found")
+        res = await _get_client().post(
+            "http://localhost:8020/query/local",
+            json={"query": query},
+        )
+        res.raise_for_status()
+        data = res.json()
+        return data.get("result", "No result found")
     except Exception as e:
         import traceback
         tb = traceback.format_exc()
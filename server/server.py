@@ -6,13 +6,35 @@
 # ]
 # ///
 
+from contextlib import asynccontextmanager
 import random
 import string
+from typing import AsyncIterator
 import httpx
 from mcp.server.fastmcp import FastMCP
 import math
 
-mcp = FastMCP("test")
+# Shared across tool calls so outgoing connections are kept alive
+_client: httpx.AsyncClient | None = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(limits=httpx.Limits(max_keepalive_connections=8))
+    return _client
+
+
+@asynccontextmanager
+async def lifespan(server: FastMCP) -> AsyncIterator[None]:
+    try:
+        yield
+    finally:
+        if _client is not None:
+            await _client.aclose()
+
+
+mcp = FastMCP("test", lifespan=lifespan)
 
 @mcp.tool()
 async def get_random() -> float:
@@ -21,7 +43,7 @@ async def get_random() -> float:
     Returns:
         float: really random number
     """
-    return random.Random().random()
+    return random.random()
 
 
 @mcp.tool()
@@ -48,7 +70,7 @@ async def random_user(count: int) -> dict:
     Returns:
         dict: user data json as dict
     """
-    res = httpx.get(f"https://randomuser.me/api?results={count}&inc=gender,name,email,phone,id")
+    res = await _get_client().get(f"https://randomuser.me/api?results={count}&inc=gender,name,email,phone,id")
     res.raise_for_status()
     return res.json()
 
@@ -57,34 +79,57 @@ async def prompter_name() -> str:
     return "My name is Ryan"
 
 # For testing purposes, returns the interface of local stdio MCP Server.
-import subprocess
+import asyncio
+import json
 import re
 from typing import Dict
-@mcp.tool()
-async def get_ip_interfaces() -> Dict[str, str]:
-    """
-    Returns a dictionary of network interfaces and their IP addresses on Ubuntu.
-    Example: {"eth0": "192.168.1.10", "lo": "127.0.0.1"}
-    """
-    result = subprocess.run(["ip", "addr"], stdout=subprocess.PIPE, text=True)
-    output = result.stdout
 
+# Only used for iproute2 versions without JSON output
+_RE_IFACE = re.compile(r"^\d+: ([\w\d@]+):")
+_RE_INET = re.compile(r"^\s+inet (\d+\.\d+\.\d+\.\d+)")
+
+def _parse_ip_addr(output: str) -> Dict[str, str]:
     interfaces = {}
     current_iface = None
 
     for line in output.splitlines():
-        if line.startswith(" "):
-            if current_iface and "inet " in line:
-                match = re.search(r"inet (\d+\.\d+\.\d+\.\d+)", line)
-                if match:
-                    interfaces[current_iface] = match.group(1)
-        else:
-            match = re.match(r"\d+: ([\w\d@]+):", line)
-            if match:
-                current_iface = match.group(1).split("@")[0]
+        # Address lines are the common case, so try them first
+        match = _RE_INET.match(line)
+        if match:
+            if current_iface:
+                interfaces[current_iface] = match.group(1)
+            continue
+
+        match = _RE_IFACE.match(line)
+        if match:
+            current_iface = match.group(1).split("@")[0]
 
     return interfaces
 
+async def _run_ip(*args: str) -> bytes:
+    # Run ip without blocking the event loop for other tool calls
+    proc = await asyncio.create_subprocess_exec("ip", *args, stdout=asyncio.subprocess.PIPE)
+    stdout, _ = await proc.communicate()
+    return stdout
+
+@mcp.tool()
+async def get_ip_interfaces() -> Dict[str, str]:
+    """
+    Returns a dictionary of network interfaces and their IP addresses on Ubuntu.
+    Example: {"eth0": "192.168.1.10", "lo": "127.0.0.1"}
+    """
+    stdout = await _run_ip("-j", "addr")
+    try:
+        data = json.loads(stdout)
+    except json.JSONDecodeError:
+        return _parse_ip_addr((await _run_ip("addr")).decode())
+
+    return {
+        entry["ifname"]: addr["local"]
+        for entry in data
+        for addr in entry.get("addr_info", [])
+        if addr.get("family") == "inet"
+    }
 
 if __name__ == "__main__":
     mcp.run(transport="stdio")
@@ -1,31 +1,189 @@
 # /// script
 # requires-python = ">=3.13"
 # dependencies = [
-#     "httpx",
+#     "httpx[http2]",
 #     "mcp[cli]",
+#     "orjson",
 # ]
 # ///
 
-import random
-import string
-import httpx
-from mcp.server.fastmcp import FastMCP
-import math
-from typing import cast
-import math
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+import functools
+from typing import Any, AsyncIterator, cast
 import httpx
+import orjson
 import os
-import re
+import time
 from dotenv import load_dotenv
-
-mcp = FastMCP("zabbix")
+from mcp.server.fastmcp import FastMCP
 
 load_dotenv()
 
 ZABBIX_API_URL   = cast(str, os.getenv("ZABBIX_API_URL"))
 ZABBIX_AUTH_TOKEN = cast(str, os.getenv("ZABBIX_AUTH_TOKEN"))
 
+# Shared across all tools so Zabbix API connections are kept alive between calls
+_client: httpx.AsyncClient | None = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        # HTTP/2 lets the gathered JSON-RPC calls share one connection; servers without h2 fall back to 1.1
+        _client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=40, max_connections=100),
+            timeout=httpx.Timeout(connect=5.0, read=30.0, write=10.0, pool=None),
+        )
+    return _client
+
+
+@asynccontextmanager
+async def lifespan(server: FastMCP) -> AsyncIterator[None]:
+    try:
+        yield
+    finally:
+        if _client is not None:
+            await _client.aclose()
+
+
+mcp = FastMCP("zabbix", lifespan=lifespan)
+
+
+async def _call(client: httpx.AsyncClient, method: str, params: dict, request_id: int = 1) -> list:
+    """Send one Zabbix JSON-RPC request and return its result"""
+    resp = await client.post(ZABBIX_API_URL, json={
+        "jsonrpc": "2.0",
+        "method": method,
+        "params": params,
+        "auth": ZABBIX_AUTH_TOKEN,
+        "id": request_id
+    })
+    resp.raise_for_status()
+    return orjson.loads(resp.content).get("result", [])
+
+
+# hostname -> (hostid, expiry); hostids are stable, so lookups are kept for a while
+_HOSTID_TTL = 300.0
+_HOSTID_CACHE_SIZE = 1024
+_hostid_cache: OrderedDict[str, tuple[str, float]] = OrderedDict()
+
+
+def _cached_hostid(hostname: str) -> str | None:
+    entry = _hostid_cache.get(hostname)
+    if entry is None:
+        return None
+    host_id, expiry = entry
+    if expiry < time.monotonic():
+        del _hostid_cache[hostname]
+        return None
+    _hostid_cache.move_to_end(hostname)
+    return host_id
+
+
+def _cache_hostid(hostname: str, host_id: str):
+    _hostid_cache[hostname] = (host_id, time.monotonic() + _HOSTID_TTL)
+    _hostid_cache.move_to_end(hostname)
+    if len(_hostid_cache) > _HOSTID_CACHE_SIZE:
+        _hostid_cache.popitem(last=False)
+
+
+async def _host_query(client: httpx.AsyncClient, hostname: str, method: str, params: dict) -> list | None:
+    """Run a host-scoped Zabbix query, or return None if the host doesn't exist
+
+    With a cached hostid the query goes out on its own. Otherwise host.get runs
+    alongside the query, which filters on the host name instead of the hostid.
+    """
+    host_id = _cached_hostid(hostname)
+    if host_id is not None:
+        return await _call(client, method, {**params, "hostids": [host_id]}, 2)
+
+    hosts, result = await asyncio.gather(
+        _call(client, "host.get", {
+            "output": ["hostid"],
+            "filter": {"host": hostname}
+        }, 1),
+        _call(client, method, {**params, "filter": {**params.get("filter", {}), "host": hostname}}, 2),
+    )
+    if not hosts:
+        return None
+
+    _cache_hostid(hostname, hosts[0]["hostid"])
+    return result
+
+
+def _format_items(items: list) -> str:
+    """Render item.get results as a bullet list, one '- name: value units' line per item"""
+    return "\n".join(
+        f"- {name}: {lastvalue} {units}".rstrip()
+        for name, lastvalue, units in ((item["name"], item["lastvalue"], item.get("units", "")) for item in items)
+    )
+
+
+# (tool, args) -> (result, expiry) for tools whose answers only change on Zabbix's polling cadence
+_RESPONSE_CACHE_SIZE = 1024
+_response_cache: OrderedDict[tuple, tuple[Any, float]] = OrderedDict()
+# Only held while callers for the key are running or waiting, counted in _response_lock_users
+_response_locks: dict[tuple, asyncio.Lock] = {}
+_response_lock_users: dict[tuple, int] = {}
+
+
+def _cached_response(key: tuple) -> Any | None:
+    entry = _response_cache.get(key)
+    if entry is None:
+        return None
+    result, expiry = entry
+    if expiry < time.monotonic():
+        del _response_cache[key]
+        return None
+    _response_cache.move_to_end(key)
+    return result
+
+
+def _cache_response(key: tuple, result: Any, ttl: float):
+    _response_cache[key] = (result, time.monotonic() + ttl)
+    _response_cache.move_to_end(key)
+    if len(_response_cache) > _RESPONSE_CACHE_SIZE:
+        _response_cache.popitem(last=False)
+
+
+def _ttl_cache(ttl: float):
+    """Reuse a tool's result for the same arguments during ttl seconds"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            key = (fn.__name__, args, tuple(sorted(kwargs.items())))
+            result = _cached_response(key)
+            if result is not None:
+                return result
+
+            # Concurrent misses for the same key wait for a single Zabbix call
+            lock = _response_locks.setdefault(key, asyncio.Lock())
+            _response_lock_users[key] = _response_lock_users.get(key, 0) + 1
+            try:
+                async with lock:
+                    result = _cached_response(key)
+                    if result is not None:
+                        return result
+                    result = await fn(*args, **kwargs)
+                    _cache_response(key, result, ttl)
+                    return result
+            finally:
+                # Dropped by the last caller only; waiters behind a failed call still share
+                # this lock, so a single one of them retries Zabbix
+                _response_lock_users[key] -= 1
+                if not _response_lock_users[key]:
+                    del _response_lock_users[key]
+                    del _response_locks[key]
+
+        return wrapper
+    return decorator
+
+
 @mcp.tool()
+@_ttl_cache(15.0)
 async def get_host_problems(hostname: str) -> list:
     """
     Get list of active problems (triggers) for a given Zabbix host name use this when the user asks for problems/all problems related to a specific host.
@@ -46,46 +204,23 @@ async def get_host_problems(hostname: str) -> list:
     Returns:
         list: List of active trigger / problems, or empty list if none, Return as points to user, Also give config fox suggestions if prompted by the user.
     """
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(ZABBIX_API_URL, json={
-            "jsonrpc": "2.0",
-            "method": "host.get",
-            "params": {
-                "output": ["hostid"],
-                "filter": {"host": hostname}
-            },
-            "auth": ZABBIX_AUTH_TOKEN,
-            "id": 1
-        })
-        resp.raise_for_status()
-        hosts = resp.json().get("result", [])
-        if not hosts:
-            return [] 
-
-        host_id = hosts[0]["hostid"]
-
-        resp = await client.post(ZABBIX_API_URL, json={
-            "jsonrpc": "2.0",
-            "method": "trigger.get",
-            "params": {
-                "output": ["description", "priority", "value"],
-                "hostids": [host_id],
-                "filter": {"value": 1},
-                "expandDescription": True,
-                "only_true": True,
-                "skipDependent": True,
-                "sortfield": "priority",
-                "sortorder": "DESC"
-            },
-            "auth": ZABBIX_AUTH_TOKEN,
-            "id": 2
-        })
-        resp.raise_for_status()
-        triggers = resp.json().get("result", [])
-
-        return ["\n".join(f"- {t['description']}" for t in triggers)]
+    client = _get_client()
+    triggers = await _host_query(client, hostname, "trigger.get", {
+        "output": ["description", "priority", "value"],
+        "filter": {"value": 1},
+        "expandDescription": True,
+        "only_true": True,
+        "skipDependent": True,
+        "sortfield": "priority",
+        "sortorder": "DESC"
+    })
+    if triggers is None:
+        return []
+
+    return ["\n".join(f"- {t['description']}" for t in triggers)]
     
 @mcp.tool()
+@_ttl_cache(30.0)
 async def get_all_problems() -> list:
     """
     Get all active problems across all hosts in Zabbix, only calls this if the user prompts to get all the problems in network.
@@ -94,28 +229,20 @@ async def get_all_problems() -> list:
     Returns:
         list: Single-element list containing all problem descriptions formatted as a bullet list.
     """
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(ZABBIX_API_URL, json={
-            "jsonrpc": "2.0",
-            "method": "trigger.get",
-            "params": {
-                "output": ["description", "priority", "value"],
-                "filter": {
-                    "value": 1 
-                },
-                "expandDescription": True,
-                "only_true": True,
-                "skipDependent": True,
-                "sortfield": "priority",
-                "sortorder": "DESC"
-            },
-            "auth": ZABBIX_AUTH_TOKEN,
-            "id": 1
-        })
-        resp.raise_for_status()
-        triggers = resp.json().get("result", [])
-
-        return ["\n".join(f"- {t['description']}" for t in triggers)]
+    client = _get_client()
+    triggers = await _call(client, "trigger.get", {
+        "output": ["description", "priority", "value"],
+        "filter": {
+            "value": 1 
+        },
+        "expandDescription": True,
+        "only_true": True,
+        "skipDependent": True,
+        "sortfield": "priority",
+        "sortorder": "DESC"
+    })
+
+    return ["\n".join(f"- {t['description']}" for t in triggers)]
 
 
 @mcp.tool()
@@ -132,58 +259,27 @@ async def get_host_health_metrics(hostname: str) -> list:
     Returns:
         list: List of formatted metrics (CPU, Temp, Memory, etc.) or empty list if none found.
     """
-    async with httpx.AsyncClient() as client:
-        # Step 1: Get host ID
-        resp = await client.post(ZABBIX_API_URL, json={
-            "jsonrpc": "2.0",
-            "method": "host.get",
-            "params": {
-                "output": ["hostid"],
-                "filter": {"host": hostname}
-            },
-            "auth": ZABBIX_AUTH_TOKEN,
-            "id": 1
-        })
-        resp.raise_for_status()
-        hosts = resp.json().get("result", [])
-        if not hosts:
-            return []
-
-        host_id = hosts[0]["hostid"]
-
-        metric_keys = [
-            "Temperature",
-            "Memory",
-            "CPU Utilization",
-        ]
-
-        result = []
-
-        for key in metric_keys:
-            resp = await client.post(ZABBIX_API_URL, json={
-                "jsonrpc": "2.0",
-                "method": "item.get",
-                "params": {
-                    "output": ["name", "lastvalue", "units"],
-                    "hostids": [host_id],
-                    "search": {
-                        "name": key
-                    },
-                    "sortfield": "name"
-                },
-                "auth": ZABBIX_AUTH_TOKEN,
-                "id": 2
-            })
-            resp.raise_for_status()
-            items = resp.json().get("result", [])
-            
-            for item in items:
-                formatted = f"- {item['name']}: {item['lastvalue']} {item.get('units', '')}".strip()
-                result.append(formatted)
-
-        combined_text = "\n".join(result)
-
-        return [combined_text]
+    client = _get_client()
+
+    metric_keys = [
+        "Temperature",
+        "Memory",
+        "CPU Utilization",
+    ]
+
+    # One item.get matching any of the metric names instead of one request per metric
+    items = await _host_query(client, hostname, "item.get", {
+        "output": ["name", "lastvalue", "units"],
+        "search": {
+            "name": metric_keys
+        },
+        "searchByAny": True,
+        "sortfield": "name"
+    })
+    if items is None:
+        return []
+
+    return [_format_items(items)]
     
 
 @mcp.tool()
@@ -199,55 +295,18 @@ async def get_host_interfaces(hostname: str) -> list:
     Returns:
         list: List of formatted interfaces on one host/device or empty list if none found.
     """
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(ZABBIX_API_URL, json={
-            "jsonrpc": "2.0",
-            "method": "host.get",
-            "params": {
-                "output": ["hostid"],
-                "filter": {"host": hostname}
-            },
-            "auth": ZABBIX_AUTH_TOKEN,
-            "id": 1
-        })
-        resp.raise_for_status()
-        hosts = resp.json().get("result", [])
-        if not hosts:
-            return []
-
-        host_id = hosts[0]["hostid"]
-
-        metric_keys = [
-            "Interface type",
-        ]
-
-        result = []
-
-        for key in metric_keys:
-            resp = await client.post(ZABBIX_API_URL, json={
-                "jsonrpc": "2.0",
-                "method": "item.get",
-                "params": {
-                    "output": ["name", "lastvalue", "units"],
-                    "hostids": [host_id],
-                    "search": {
-                        "name": key
-                    },
-                    "sortfield": "name"
-                },
-                "auth": ZABBIX_AUTH_TOKEN,
-                "id": 2
-            })
-            resp.raise_for_status()
-            items = resp.json().get("result", [])
-            
-            for item in items:
-                formatted = f"- {item['name']}: {item['lastvalue']} {item.get('units', '')}".strip()
-                result.append(formatted)
-
-        combined_text = "\n".join(result)
-
-        return [combined_text]
+    client = _get_client()
+    items = await _host_query(client, hostname, "item.get", {
+        "output": ["name", "lastvalue", "units"],
+        "search": {
+            "name": "Interface type"
+        },
+        "sortfield": "name"
+    })
+    if items is None:
+        return []
+
+    return [_format_items(items)]
 
 @mcp.tool()
 async def get_interface_info(hostname: str, interface: str) -> list:
@@ -268,51 +327,33 @@ async def get_interface_info(hostname: str, interface: str) -> list:
     Returns:
         list: List of formatted metrics for the given interface, or empty if not found, say no interface found if this tools return empty string.
     """
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(ZABBIX_API_URL, json={
-            "jsonrpc": "2.0",
-            "method": "host.get",
-            "params": {
-                "output": ["hostid"],
-                "filter": {"host": hostname}
-            },
-            "auth": ZABBIX_AUTH_TOKEN,
-            "id": 1
-        })
-        resp.raise_for_status()
-        hosts = resp.json().get("result", [])
-        if not hosts:
-            return []
-
-        host_id = hosts[0]["hostid"]
-
-        # Step 2: Get all items related to the specific interface
-        search_string = interface
-        resp = await client.post(ZABBIX_API_URL, json={
-            "jsonrpc": "2.0",
-            "method": "item.get",
-            "params": {
-                "output": ["name", "lastvalue", "units"],
-                "hostids": [host_id],
-                "search": {
-                    "name": search_string
-                },
-                "sortfield": "name"
-            },
-            "auth": ZABBIX_AUTH_TOKEN,
-            "id": 2
-        })
-        resp.raise_for_status()
-        items = resp.json().get("result", [])
-
-        result = []
-        for item in items:
-                formatted = f"- {item['name']}: {item['lastvalue']} {item.get('units', '')}".strip()
-                result.append(formatted)
-
-        combined_text = "\n".join(result)
-
-        return [combined_text]
+    client = _get_client()
+    # Get all items related to the specific interface
+    items = await _host_query(client, hostname, "item.get", {
+        "output": ["name", "lastvalue", "units"],
+        "search": {
+            "name": interface
+        },
+        "sortfield": "name"
+    })
+    if items is None:
+        return []
+
+    return [_format_items(items)]
+
+
+@mcp.tool()
+async def clear_cache() -> str:
+    """
+    Clear the cached Zabbix problem lists and host lookups.
+    Only use this when the user explicitly asks for fresh / uncached data.
+
+    Returns:
+        str: Confirmation message.
+    """
+    _response_cache.clear()
+    _hostid_cache.clear()
+    return "Zabbix cache cleared"
 
 
 if __name__ == "__main__":
@@ -1,7 +1,9 @@
 import json
+import os
 from typing import Self, List, Optional
 from mcp import StdioServerParameters
-from pydantic import RootModel, BaseModel
+import orjson
+from pydantic import PrivateAttr, RootModel, BaseModel
 
 
 class HttpServerConfig(BaseModel):
@@ -17,31 +19,35 @@ class ConfigContainer(RootModel):
 
     root: dict[str, StdioServerParameters]
 
+    _keys_cache: list[str] | None = PrivateAttr(default=None)
+    _http_servers: list[HttpServerConfig] = PrivateAttr(default_factory=list)
+
     def __getitem__(self, index: int) -> tuple:
         if not self.root:
             raise ValueError("No configurations found")
 
-        name = list(self.root.keys())[index]
+        if self._keys_cache is None:
+            self._keys_cache = list(self.root.keys())
+        name = self._keys_cache[index]
         return name, self.root[name]
 
     def items(self):
-        """Return only stdio server items, excluding http_servers"""
-        return {k: v for k, v in self.root.items() if k != "http_servers"}.items()
+        """Return stdio server items; http_servers are kept separately"""
+        return self.root.items()
 
     def get_http_servers(self) -> List[HttpServerConfig]:
         """Get all HTTP server configurations"""
-        http_servers = []
-        
-        if "http_servers" in self.root:
-            http_config = self.root["http_servers"]
-            if isinstance(http_config, list):
-                for i, server in enumerate(http_config):
-                    if isinstance(server, str):
-                        http_servers.append(HttpServerConfig(url=server, name=f"http_{i}"))
-                    elif isinstance(server, dict):
-                        http_servers.append(HttpServerConfig(**server))
-        
-        return http_servers
+        return self._http_servers
+
+    def _set_http_servers(self, http_config: object):
+        """Parse the raw http_servers entry once, when the config is loaded"""
+        self._http_servers = []
+        if isinstance(http_config, list):
+            for i, server in enumerate(http_config):
+                if isinstance(server, str):
+                    self._http_servers.append(HttpServerConfig(url=server, name=f"http_{i}"))
+                elif isinstance(server, dict):
+                    self._http_servers.append(HttpServerConfig(**server))
 
     @classmethod
     def form_file(cls, file_path: str) -> Self:
@@ -54,15 +60,25 @@ class ConfigContainer(RootModel):
             Self: ConfigContainer
         """
         try:
-            with open(file_path, "r") as file:
-                json_data = json.load(file)
+            key = (file_path, os.stat(file_path).st_mtime_ns)
+            if key in _config_cache:
+                return _config_cache[key]
+
+            with open(file_path, "rb") as file:
+                json_data = orjson.loads(file.read())
         except (FileNotFoundError, json.JSONDecodeError) as e:
             raise ValueError(f"Error reading file: {e}")
 
         try:
-            stdio_data = {k: v for k, v in json_data.items() if k != "http_servers"}
-            instance = cls(root=stdio_data)
-            instance.root["http_servers"] = json_data.get("http_servers", [])
-            return instance
+            http_servers = json_data.pop("http_servers", [])
+            instance = cls(root=json_data)
+            instance._set_http_servers(http_servers)
         except Exception as e:
-            raise ValueError(f"Error processing configuration: {e}")
\ No newline at end of file
+            raise ValueError(f"Error processing configuration: {e}")
+
+        _config_cache[key] = instance
+        return instance
+
+
+# (path, mtime) -> parsed config, so unchanged files are only read once
+_config_cache: dict[tuple[str, int], ConfigContainer] = {}
@@ -0,0 +1,397 @@
+import asyncio
+from contextlib import AbstractAsyncContextManager, AsyncExitStack
+import logging
+import os
+import time
+from typing import Any, Final, Optional, Self, Sequence, cast
+
+import httpx
+import orjson
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+from mcp.client.streamable_http import streamablehttp_client
+from mcp.types import TextContent, Tool as MCPTool
+from ollama import AsyncClient, Tool
+
+from abstract.config_container import ConfigContainer, HttpServerConfig
+from abstract.session import Session
+
+SYSTEM_PROMPT: Final[str] = """
+You are a helpful assistant capable of accessing external functions and engaging in casual chat.
+Use the responses from these function calls to provide accurate and informative answers.
+The answers should be natural and hide the fact that you are using tools to access real-time information.
+Guide the user about available tools and their capabilities.
+Always utilize tools to access real-time information when required.
+Engage in a friendly manner to enhance the chat experience.
+(IMPORTANT) Always pass the function rawly from the user, do not modify it. e.g if the user asks to get a config from 'L2 Cisco 2960X IB_1F', just pass it as is, do not change it to 'L2_Cisco_2960X_IB_1F
+
+# Notes
+- Use English in every conversation.
+- Make function calls efficient, only call functions one time if not needed for multi function call.
+- Ensure responses are based on the latest information available from function calls.
+- Maintain an engaging, supportive, and friendly tone throughout the dialogue.
+- Always highlight the potential of available tools to assist users comprehensively.
+- Always pass the function rawly from the user, do not modify it. e.g if the user asks to get a config from 'L2 Cisco 2960X IB_1F', just pass it as is, do not change it to 'L2_Cisco_2960X_IB_1F'.
+"""
+
+
+def configure_logger(name: str) -> logging.Logger:
+    """Return the named logger, giving it a console handler the first time
+
+    The level comes from MCP_LOG_LEVEL (INFO by default) and the handler is only
+    colored when MCP_COLOR_LOGS is set.
+    """
+    logger = logging.getLogger(name)
+    logger.setLevel(os.getenv("MCP_LOG_LEVEL", "INFO").upper())
+
+    if not logger.hasHandlers():
+        console_handler = logging.StreamHandler()
+        if os.getenv("MCP_COLOR_LOGS"):
+            import colorlog
+
+            formatter = colorlog.ColoredFormatter(
+                "%(log_color)s%(levelname)s%(reset)s - %(message)s",
+                datefmt=None,
+                reset=True,
+                log_colors={
+                    "DEBUG": "cyan",
+                    "INFO": "green",
+                    "WARNING": "yellow",
+                    "ERROR": "red",
+                    "CRITICAL": "bold_red",
+                },
+            )
+        else:
+            formatter = logging.Formatter("%(levelname)s - %(message)s")
+        console_handler.setFormatter(formatter)
+        logger.addHandler(console_handler)
+
+    return logger
+
+
+def mcp_http_client_factory(
+    headers: dict[str, str] | None = None, timeout: httpx.Timeout | None = None, auth: httpx.Auth | None = None
+) -> httpx.AsyncClient:
+    """mcp's default HTTP client plus HTTP/2, so concurrent tool calls on a session share one connection"""
+    return httpx.AsyncClient(
+        http2=True,
+        follow_redirects=True,
+        headers=headers,
+        timeout=timeout or httpx.Timeout(30.0),
+        auth=auth,
+        limits=httpx.Limits(max_keepalive_connections=40, max_connections=100, keepalive_expiry=30.0),
+    )
+
+
+class OrjsonAsyncClient(AsyncClient):
+    """ollama AsyncClient that encodes request bodies with orjson instead of httpx's json.dumps
+
+    The whole chat history is sent on every chat call, so the encoder is on the hot path.
+    """
+
+    async def _request(self, cls, *args, stream: bool = False, **kwargs):
+        body = kwargs.get("json")
+        if body is not None:
+            try:
+                kwargs["content"] = orjson.dumps(body)
+            except orjson.JSONEncodeError:
+                # Leave anything orjson can't encode to httpx
+                pass
+            else:
+                del kwargs["json"]
+        return await super()._request(cls, *args, stream=stream, **kwargs)
+
+
+# Server key -> (listed at, tools), shared by every client in the process so reconnecting to
+# the same server skips the list_tools round trip
+_list_tools_cache: dict[tuple, tuple[float, list[MCPTool]]] = {}
+
+
+async def list_tools_cached(session: ClientSession, key: tuple | None, ttl: float | None) -> list[MCPTool]:
+    """session.list_tools(), reusing a listing of the same server made less than ttl seconds ago"""
+    if key is not None and ttl:
+        entry = _list_tools_cache.get(key)
+        if entry is not None and time.monotonic() - entry[0] < ttl:
+            return entry[1]
+
+    response = await session.list_tools()
+    if key is not None and ttl:
+        _list_tools_cache[key] = (time.monotonic(), response.tools)
+    return response.tools
+
+
+class MCPClientBase(AbstractAsyncContextManager):
+    """Server connections, tool routing and tool calls shared by the MCP clients
+
+    Subclasses set self.logger and add the model side: prompting, history and caching.
+    """
+
+    logger: logging.Logger
+
+    def __init__(self):
+        self.servers: dict[str, Session] = {}
+        self.selected_server: dict[str, Session] = {}
+        self.exit_stack = AsyncExitStack()
+
+        # Counts every HTTP connect, pooled or not, to number unnamed servers like before;
+        # the transports themselves live on the exit stack
+        self._http_connection_count = 0
+        # One session per distinct server, so a server configured under several names is
+        # connected, initialized and listed once
+        self._session_pool: dict[tuple, ClientSession] = {}
+        self._session_keys: dict[int, tuple] = {}
+        self._session_listings: dict[int, asyncio.Future[list[MCPTool]]] = {}
+        # Caps how many tool calls of one reply run at the same time
+        self._tool_semaphore = asyncio.Semaphore(int(os.getenv("MCP_TOOL_CONCURRENCY", "8")))
+        self._servers_list_cached: tuple[str, ...] | None = None
+        self._selected_servers_list_cached: tuple[str, ...] | None = None
+        self._tools_cache: tuple[Tool, ...] | None = None
+        self._tool_index: dict[str, tuple[ClientSession, str]] | None = None
+
+    async def _close_sessions(self):
+        try:
+            await self.exit_stack.aclose()
+        except Exception as e:
+            self.logger.warning("Failed to close MCP sessions: %s", e)
+
+        # Everything below went away with the exit stack
+        self.servers = {}
+        self.selected_server = {}
+        self._session_pool.clear()
+        self._session_keys.clear()
+        self._session_listings.clear()
+        self._invalidate_server_caches()
+
+    async def _connect_to_multiple_servers(self, config: ConfigContainer, cache_ttl: float | None = None):
+        # Same split as connect_to_streamable_http_servers: spawn the servers one by one in
+        # this task, then overlap their initialize and list_tools round trips. A server that
+        # fails either step is logged and left out instead of aborting the others.
+        sessions = []
+        for name, params in config.items():
+            try:
+                sessions.append((name, await self._open_stdio_session(params)))
+            except Exception as e:
+                self.logger.error("Failed to start server %s: %s", name, e)
+
+        all_tools = await asyncio.gather(
+            *(self._list_session_tools(name, session, cache_ttl) for name, session in sessions), return_exceptions=True
+        )
+        for (name, session), tools in zip(sessions, all_tools):
+            if isinstance(tools, Exception):
+                self.logger.error("Failed to connect to server %s: %s", name, tools)
+                continue
+            if isinstance(tools, BaseException):
+                raise tools
+            self.servers[name] = Session(session=session, tools=tools)
+
+        self.selected_server = self.servers
+        self._invalidate_server_caches()
+
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(
+                "Connected to stdio servers with tools: %s", [cast(Tool.Function, tool.function).name for tool in self.get_tools()]
+            )
+
+    async def connect_to_streamable_http_server(
+        self,
+        server_url: str,
+        headers: Optional[dict] = None,
+        server_name: Optional[str] = None,
+        cache: bool = True,
+        cache_ttl_seconds: float = 300.0,
+    ):
+        """Connect to an MCP server running with HTTP Streamable transport"""
+        if server_name is None:
+            server_name = f"http_{self._http_connection_count}"
+        self._http_connection_count += 1
+
+        session = await self._open_streamable_http_session(server_url, headers)
+        tools = await self._list_session_tools(server_name, session, cache_ttl_seconds if cache else None)
+        self._add_http_server(server_name, session, tools)
+
+    async def connect_to_streamable_http_servers(
+        self,
+        servers: Sequence[HttpServerConfig],
+        headers: Optional[dict] = None,
+        cache: bool = True,
+        cache_ttl_seconds: float = 300.0,
+    ):
+        """Connect to several MCP servers running with HTTP Streamable transport
+
+        The transports are entered one by one in the calling task, since they have to be
+        exited from the task that entered them; the initialize and list_tools round trips
+        then run concurrently.
+        """
+        cache_ttl = cache_ttl_seconds if cache else None
+        sessions = []
+        for server in servers:
+            server_name = server.name or f"http_{self._http_connection_count}"
+            self._http_connection_count += 1
+            sessions.append((server_name, await self._open_streamable_http_session(server.url, headers)))
+
+        all_tools = await asyncio.gather(
+            *(self._list_session_tools(server_name, session, cache_ttl) for server_name, session in sessions)
+        )
+        for (server_name, session), tools in zip(sessions, all_tools):
+            self._add_http_server(server_name, session, tools)
+
+    async def _open_streamable_http_session(self, server_url: str, headers: Optional[dict]) -> ClientSession:
+        key = ("http", server_url, tuple(sorted((headers or {}).items())))
+        if key in self._session_pool:
+            return self._session_pool[key]
+
+        read_stream, write_stream, _ = await self.exit_stack.enter_async_context(
+            streamablehttp_client(url=server_url, headers=headers or {}, httpx_client_factory=mcp_http_client_factory)
+        )
+        session = cast(ClientSession, await self.exit_stack.enter_async_context(ClientSession(read_stream, write_stream)))
+
+        self._session_pool[key] = session
+        self._session_keys[id(session)] = key
+        return session
+
+    async def _open_stdio_session(self, server_params: StdioServerParameters) -> ClientSession:
+        """Start an MCP server over stdio and open a session to it"""
+        key = ("stdio", server_params.model_dump_json())
+        if key in self._session_pool:
+            return self._session_pool[key]
+
+        stdio, write = await self.exit_stack.enter_async_context(stdio_client(server_params))
+        session = cast(ClientSession, await self.exit_stack.enter_async_context(ClientSession(stdio, write)))
+        self._session_pool[key] = session
+        self._session_keys[id(session)] = key
+        return session
+
+    async def _list_session_tools(self, server_name: str, session: ClientSession, cache_ttl: float | None = None) -> list[Tool]:
+        listing = self._session_listings.get(id(session))
+        if listing is None:
+            listing = asyncio.ensure_future(self._initialize_session(session, cache_ttl))
+            self._session_listings[id(session)] = listing
+
+        try:
+            mcp_tools = await listing
+        except Exception:
+            # Don't keep a failed listing around, the next connect to this server retries it
+            if self._session_listings.get(id(session)) is listing:
+                del self._session_listings[id(session)]
+            raise
+
+        # Hoisted out of the comprehension, servers can expose a lot of tools
+        function = Tool.Function
+        prefix = server_name + "/"
+        return [
+            Tool(
+                type="function",
+                function=function(name=prefix + tool.name, description=tool.description, parameters=tool.inputSchema),
+            )
+            for tool in mcp_tools
+        ]
+
+    async def _initialize_session(self, session: ClientSession, cache_ttl: float | None) -> list[MCPTool]:
+        await session.initialize()
+        return await list_tools_cached(session, self._session_keys.get(id(session)), cache_ttl)
+
+    def _add_http_server(self, server_name: str, session: ClientSession, tools: list[Tool]):
+        self.servers[server_name] = Session(session=session, tools=tools)
+
+        if not self.selected_server:
+            self.selected_server = {server_name: self.servers[server_name]}
+        else:
+            self.selected_server[server_name] = self.servers[server_name]
+        self._invalidate_server_caches()
+
+    @property
+    def servers_list_cached(self) -> tuple[str, ...]:
+        """Names of all connected servers, rebuilt only after the server set changes"""
+        if self._servers_list_cached is None:
+            self._servers_list_cached = tuple(self.servers)
+        return self._servers_list_cached
+
+    @property
+    def selected_servers_list_cached(self) -> tuple[str, ...]:
+        """Names of the selected servers, rebuilt only after the selection changes"""
+        if self._selected_servers_list_cached is None:
+            self._selected_servers_list_cached = tuple(self.selected_server)
+        return self._selected_servers_list_cached
+
+    def _invalidate_server_caches(self):
+        self._servers_list_cached = None
+        self._selected_servers_list_cached = None
+        self._tools_cache = None
+        self._tool_index = None
+
+    def get_tools(self) -> Sequence[Tool]:
+        """Tools of the selected servers, rebuilt only after the selection changes"""
+        if self._tools_cache is None:
+            tools: list[Tool] = []
+            for server in self.selected_server.values():
+                tools.extend(server.tools)
+            self._tools_cache = tuple(tools)
+        return self._tools_cache
+
+    def _get_tool_index(self) -> dict[str, tuple[ClientSession, str]]:
+        """Full 'server/tool' name -> (session, tool name) for the selected servers"""
+        if self._tool_index is None:
+            self._tool_index = {}
+            for server in self.selected_server.values():
+                for tool in server.tools:
+                    name = cast(Tool.Function, tool.function).name
+                    self._tool_index[name] = (server.session, name.partition("/")[2])
+        return self._tool_index
+
+    def select_server(self, servers: list[str]) -> Self:
+        wanted = frozenset(servers).intersection(self.servers)
+        if wanted == self.selected_server.keys():
+            # Same selection, keep the cached tool list and index
+            return self
+
+        self.selected_server = {name: server for name, server in self.servers.items() if name in wanted}
+        self._invalidate_server_caches()
+        self.logger.info("Selected server: %s", list(self.selected_servers_list_cached))
+        return self
+
+    async def _tool_call(self, tool_calls: Sequence[Any]) -> list[str]:
+        """Execute tool calls concurrently and return formatted results in call order
+
+        Each call only needs function.name and function.arguments, like ollama's Message.ToolCall.
+        """
+        async def _run_one(i: int, tool) -> str:
+            tool_args = tool.function.arguments
+            # Shown to the model as JSON, the format it wrote the arguments in; falls back to
+            # the raw value if they can't be serialized
+            args_text = tool_args
+
+            # Bad arguments or routing become an error block for the model instead of failing the reply
+            try:
+                if not isinstance(tool_args, dict):
+                    tool_args = dict(tool_args)
+                args_text = orjson.dumps(tool_args, default=str).decode()
+
+                entry = self._get_tool_index().get(tool.function.name)
+                if entry is not None:
+                    session, tool_name = entry
+                else:
+                    # Not a listed tool; route it by its prefix like before, or to the first server
+                    server_name, sep, tool_name = tool.function.name.partition("/")
+                    if not sep:
+                        tool_name = server_name
+                    server = self.selected_server.get(server_name) or next(iter(self.selected_server.values()), None)
+                    if server is None:
+                        raise ValueError("No server selected")
+                    session = server.session
+
+                async with self._tool_semaphore:
+                    result = await session.call_tool(tool_name, tool_args)
+                self.logger.debug("Tool call result for %s: %s", tool.function.name, result.content)
+
+                # Keep every text segment, not only the first one
+                result_text = "\n".join(c.text for c in result.content if isinstance(c, TextContent))
+
+                formatted_result = f"=== TOOL RESULT #{i+1} ===\nTool: {tool.function.name}\nArguments: {args_text}\nResult:\n{result_text}\n=========================="
+                return formatted_result
+
+            except Exception as e:
+                self.logger.error("Tool call error for %s: %s", tool.function.name, e)
+                error_result = f"=== TOOL ERROR #{i+1} ===\nTool: {tool.function.name}\nArguments: {args_text}\nError: {e}\n=========================="
+                return error_result
+
+        return list(await asyncio.gather(*(_run_one(i, tool) for i, tool in enumerate(tool_calls))))
@@ -1,55 +1,41 @@
-import json
-from fastapi import FastAPI, HTTPException, Response
-from fastapi.responses import StreamingResponse
-import asyncio
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
 from contextlib import asynccontextmanager
+import orjson
 
 # Import your OllamaMCPClient from the original file
 from abstract.config_container import ConfigContainer
 from clients.ollama_client import OllamaMCPClient
 
-# Global client instance
-client_instance = None
-client_lock = asyncio.Lock()
-
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup: initialize the client
-    global client_instance
     # You'll need to initialize your config here
     config = ConfigContainer.form_file("examples/server.json")
-    client_instance = await OllamaMCPClient.create(config)
+    client = await OllamaMCPClient.create(config)
+    app.state.client = client
 
     yield
 
     # Shutdown: cleanup the client
-    if client_instance:
-        await client_instance.__aexit__(None, None, None)
+    app.state.client = None
+    await client.__aexit__(None, None, None)
 
 
 # Create FastAPI app with lifespan handler
-app = FastAPI(title="Ollama MCP API", lifespan=lifespan)
-
-
-async def get_client():
-    global client_instance, client_lock
+app = FastAPI(title="Ollama MCP API", lifespan=lifespan, default_response_class=ORJSONResponse)
+app.state.client = None
 
-    if client_instance is not None:
-        return client_instance
 
-    # Use a lock to prevent multiple initializations
-    async with client_lock:
-        if client_instance is None:
-            try:
-                config = ConfigContainer.form_file("examples/server.json")
-                client_instance = await OllamaMCPClient.create(config)
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"Failed to initialize client: {str(e)}")
-
-    return client_instance
+def get_client(request: Request) -> OllamaMCPClient:
+    """Resolve the client stored on the app by lifespan"""
+    client: Optional[OllamaMCPClient] = request.app.state.client
+    if client is None:
+        raise HTTPException(status_code=500, detail="Client not initialized")
+    return client
 
 
 class ChatRequest(BaseModel):
@@ -58,57 +44,53 @@ class ChatRequest(BaseModel):
 
 
 @app.post("/api/chat")
-async def stream_chat(request: ChatRequest):
-    client = await get_client()
-
-    iter = client.process_message(request.message, request.model)
-    first_chunk = None
-
+async def stream_chat(request: ChatRequest, client: OllamaMCPClient = Depends(get_client)):
     async def response_generator():
-        if first_chunk:
-            yield json.dumps(first_chunk)
-        async for part in iter:
-            yield json.dumps(part)
-            await asyncio.sleep(0.01)
-
-    try:
-        first_chunk = await iter.__anext__()
-        return StreamingResponse(
-            response_generator(),
-            media_type="text/event-stream",
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"{e}")
+        # Headers are already sent once this runs, so failures are reported as a final frame
+        try:
+            async for part in client.process_message(request.message, request.model):
+                yield b"data: " + orjson.dumps(part) + b"\n\n"
+        except Exception as e:
+            client.logger.error("Chat error: %s", e)
+            yield b"data: " + orjson.dumps({"error": str(e)}) + b"\n\n"
+
+    return StreamingResponse(
+        response_generator(),
+        media_type="text/event-stream",
+    )
 
 
 @app.delete("/api/chat")
-async def delete_chat():
-    client = await get_client()
+async def delete_chat(client: OllamaMCPClient = Depends(get_client)):
     await client.prepare_prompt()
 
 
+# Serialized tool list, rebuilt only when the server selection changes
+_tools_cache: bytes | None = None
+
+
 @app.get("/api/tools")
-async def get_tools():
-    client = await get_client()
-    tools = client.get_tools()
+async def get_tools(client: OllamaMCPClient = Depends(get_client)):
+    global _tools_cache
+    if _tools_cache is None:
+        _tools_cache = orjson.dumps([tool.model_dump() for tool in client.get_tools()])
 
-    return Response(json.dumps([tool.model_dump() for tool in tools]), media_type="text/json")
+    return Response(_tools_cache, media_type="application/json")
 
 
 @app.get("/api/servers")
-async def get_server():
-    client = await get_client()
-    return Response(json.dumps(list(client.selected_server.keys())))
+async def get_server(client: OllamaMCPClient = Depends(get_client)):
+    return client.selected_servers_list_cached
 
 
 @app.put("/api/servers")
-async def select_server(request: list[str]):
-    client = await get_client()
+async def select_server(request: list[str], client: OllamaMCPClient = Depends(get_client)):
+    global _tools_cache
     client.select_server(request)
+    _tools_cache = None
 
 
 @app.get("/api/models")
-async def get_models():
-    client = await get_client()
+async def get_models(client: OllamaMCPClient = Depends(get_client)):
     models = await client.client.list()
-    return Response(json.dumps([m.model for m in models.models]), media_type="text/json")
+    return [m.model for m in models.models]
@@ -0,0 +1,53 @@
+import asyncio
+
+from rag_http import SEPARATOR, clean_rag_response, stream_clean_rag_response
+
+
+def _transcript(answer: str) -> str:
+    return (
+        "Let me check.\n"
+        "=== TOOL RESULT #1 ===\nTool: zabbix/get_all_problems\nArguments: {}\nResult:\n- Disk full\n"
+        f"{SEPARATOR}\n\n{answer}\n"
+    )
+
+
+def test_short_final_answer_is_kept_alone():
+    assert clean_rag_response(_transcript("Yes.")) == "Yes."
+    assert clean_rag_response(_transcript("42 hosts")) == "42 hosts"
+
+
+def test_long_final_answer_is_kept_alone():
+    answer = "There is one active problem: the disk is full."
+    assert clean_rag_response(_transcript(answer)) == answer
+
+
+def test_reply_without_tool_results_is_returned_whole():
+    assert clean_rag_response("  Hello there!\n") == "Hello there!"
+
+
+async def _parts(*parts):
+    for role, content in parts:
+        yield {"role": role, "content": content}
+
+
+def _stream(*parts) -> str:
+    async def collect():
+        return "".join([piece async for piece in stream_clean_rag_response(_parts(*parts))])
+
+    return asyncio.run(collect())
+
+
+def test_stream_drops_text_of_tool_calling_rounds():
+    parts = (
+        ("assistant", "Let me check.\n"),
+        ("assistant", 'TOOL_CALL: zabbix/get_all_problems\nARGUMENTS: {}\nEND_TOOL_CALL'),
+        ("tool", f"=== TOOL RESULT #1 ===\nTool: zabbix/get_all_problems\nArguments: {{}}\nResult:\n- Disk full\n{SEPARATOR}"),
+        ("assistant", "Yes."),
+    )
+    full = "".join(content for _, content in parts)
+    assert _stream(*parts) == clean_rag_response(full) == "Yes."
+
+
+def test_stream_without_tool_calls_matches_non_streaming():
+    parts = (("assistant", "Hello "), ("assistant", "there!\n"))
+    assert _stream(*parts) == clean_rag_response("Hello there!\n") == "Hello there!"